@@ -1,16 +1,23 @@
 import os
+import csv
 import json
 import asyncio
 import threading
+import time
 import sqlite3
 import base58
+import numpy as np
 import requests
-from threading import Timer
-from datetime import datetime
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.constants import ParseMode
 from telegram.ext import (
     Application,
+    BasePersistence,
+    PersistenceInput,
     CommandHandler,
     CallbackQueryHandler,
     ContextTypes,
@@ -21,8 +28,16 @@ from telegram.ext import (
 # Solana imports
 from solders.keypair import Keypair
 from solana.rpc.async_api import AsyncClient
+from solana.rpc.websocket_api import SubscriptionError, connect
 from solders.pubkey import Pubkey
 from solders.system_program import TransferParams, transfer
+from solders.compute_budget import set_compute_unit_limit, set_compute_unit_price
+from solders.account_decoder import UiAccountEncoding
+from solders.commitment_config import CommitmentLevel
+from solders.rpc.config import RpcAccountInfoConfig
+from solders.rpc.requests import AccountSubscribe
+from solders.rpc.responses import SubscriptionResult
+from websockets.exceptions import ConnectionClosed
 import solana
 from solana.transaction import Transaction
 
@@ -49,15 +64,71 @@ CENTRAL_ADDRESS = {
     'TON': 'EQCD39VS5jcptHL8vMjEXrzGaRcCVYto7HUn4bpAOg8xqB2N'
 }
 SOLANA_RPC = "https://api.mainnet-beta.solana.com"
+SOLANA_WS = "wss://api.mainnet-beta.solana.com"
 ETHEREUM_RPC = "https://mainnet.infura.io/v3/YOUR_INFURA_KEY"
 TON_RPC = "https://toncenter.com/api/v2/jsonRPC"
 
+# Additional endpoints per chain are load-balanced by RpcPool
+SOLANA_RPC_ENDPOINTS = [SOLANA_RPC]
+ETHEREUM_RPC_ENDPOINTS = [ETHEREUM_RPC]
+TON_RPC_ENDPOINTS = [TON_RPC]
+
+# RPC pool configuration
+RPC_EWMA_ALPHA = 0.2  # Weight of the newest latency sample
+RPC_HEDGE_DEFAULT_DELAY = 0.5  # Seconds before hedging until an endpoint has enough samples
+RPC_HEDGE_MIN_SAMPLES = 20
+RPC_MAX_FAILURES = 3  # Consecutive errors before an endpoint is benched
+RPC_FAILURE_COOLDOWN = 30  # Seconds a benched endpoint sits out
+RPC_HEALTH_CHECK_INTERVAL = 15
+
 # Database configuration
 DB_FILE = "multichain_bot.db"
 TOKEN = "7818292076:AAH2JkUUIab2KO_3I04lc8AFhUA3YRz3H7w"
 ADMIN_IDS = [6216175814, 5006318648]
 LOG_CHANNEL = -1002534917643
 
+# Instant rug exit configuration
+RUG_LIQUIDITY_DROP_THRESHOLD = 0.5  # Exit once pool liquidity falls 50% below its peak
+RUG_EXIT_LATENCY_BUDGET = 2.0  # Seconds allowed to quote, build and sign an exit
+RUG_EXIT_RETRY_BACKOFF = 1.0  # Seconds before retrying a failed exit, doubling per failure
+RUG_EXIT_RETRY_MAX_BACKOFF = 60.0
+RUG_WATCH_SYNC_INTERVAL = 30  # Seconds between position index reloads
+POOLS_PER_CONNECTION = 500  # Pool subscriptions multiplexed on one websocket
+
+# Transaction history configuration
+HISTORY_PAGE_SIZE = 10
+EXPORT_CHUNK_SIZE = 1000
+
+# Referral configuration
+REFERRAL_MAX_LEVELS = 10  # Upline levels credited with counts and volume
+
+# Fee oracle configuration
+FEE_TIER_PERCENTILES = {'Low': 25, 'Medium': 50, 'High': 90}  # transaction_priority -> percentile
+FEE_SAMPLE_INTERVAL = 10  # Seconds between fee samples
+FEE_WINDOW = 300  # Slots/blocks kept for rolling percentiles
+ETH_FEE_HISTORY_BLOCKS = 20  # Blocks requested per eth_feeHistory sample
+# Write-locked accounts whose fee markets set the SOL tiers. Without accounts
+# getRecentPrioritizationFees returns each slot's minimum landed fee (~0).
+# Watched rug-exit pools are added automatically; add the AMM pools/vaults
+# the bot trades through here.
+SOLANA_FEE_ACCOUNTS = [CENTRAL_ADDRESS['SOL']]
+SOLANA_FEE_MAX_ACCOUNTS = 128  # RPC limit per request
+SOLANA_PRIORITY_FEE_FLOOR = {'Low': 0, 'Medium': 1_000, 'High': 10_000}  # micro-lamports per CU
+# Priority fee = price x requested limit (default 200k CU per instruction), so
+# the limit is sized to the transaction: 150 CU for the system transfer plus
+# 150 for each compute budget instruction
+SOLANA_TRANSFER_COMPUTE_UNITS = 450
+
+# Wallet generation
+WALLET_WORKERS = 4  # Threads generating keypairs off the event loop
+DEFAULT_CHAIN = 'SOL'  # Matches the users.active_chain default
+
+# Admin analytics rollups
+ROLLUP_BUCKETS = (('hour', '%Y-%m-%d %H:00'), ('day', '%Y-%m-%d'))  # UTC, like CURRENT_TIMESTAMP
+
+# Conversation state persistence
+PERSISTENCE_FLUSH_INTERVAL = 5  # Seconds between batched writes of changed user/chat data
+
 # Initialize database
 def init_db():
     conn = sqlite3.connect(DB_FILE)
@@ -134,6 +205,76 @@ def init_db():
         )
     ''')
     
+    # Open positions table (watched by the rug exit watcher). For SOL,
+    # pool_address is the account whose lamports track the pool's SOL
+    # reserves (e.g. the AMM's WSOL vault), not the AMM state account
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS positions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            chain TEXT,
+            token_address TEXT,
+            pool_address TEXT,
+            amount REAL,
+            status TEXT DEFAULT 'open',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+    ''')
+    # Materialized referral aggregates, kept current by create_user/log_transaction
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS referral_stats (
+            user_id INTEGER PRIMARY KEY,
+            direct_referrals INTEGER DEFAULT 0,
+            total_referrals INTEGER DEFAULT 0,
+            depth INTEGER DEFAULT 0,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS referral_volume (
+            user_id INTEGER,
+            chain TEXT,
+            direct_volume REAL DEFAULT 0.0,
+            total_volume REAL DEFAULT 0.0,
+            PRIMARY KEY(user_id, chain),
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+    ''')
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_referral_stats_total ON referral_stats (total_referrals DESC)"
+    )
+    
+    # Per-bucket transaction and signup rollups for admin analytics
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tx_rollups (
+            bucket_type TEXT,
+            bucket TEXT,
+            chain TEXT,
+            tx_type TEXT,
+            tx_count INTEGER DEFAULT 0,
+            volume REAL DEFAULT 0.0,
+            PRIMARY KEY(bucket_type, bucket, chain, tx_type)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS signup_rollups (
+            bucket_type TEXT,
+            bucket TEXT,
+            new_users INTEGER DEFAULT 0,
+            PRIMARY KEY(bucket_type, bucket)
+        )
+    ''')
+    
+    # Keyset index for history pages and exports
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_transactions_user_time ON transactions (user_id, timestamp, id)"
+    )
+    
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_positions_pool ON positions (status, pool_address)"
+    )
+    
     conn.commit()
     return conn
 
@@ -144,45 +285,186 @@ db_cursor = db_conn.cursor()
 # Initialize bot
 bot = Bot(TOKEN)
 
+# ======================
+# RPC Pool
+# ======================
+
+class EndpointStats:
+    """Latency and health of one RPC endpoint, shared by every client for it"""
+    
+    def __init__(self, url):
+        self.url = url
+        self.ewma = None
+        self.samples = deque(maxlen=200)
+        self.failures = 0
+        self.benched_until = 0.0
+    
+    @property
+    def healthy(self):
+        return time.monotonic() >= self.benched_until
+    
+    def record_latency(self, latency):
+        self.samples.append(latency)
+        self.ewma = latency if self.ewma is None else (
+            RPC_EWMA_ALPHA * latency + (1 - RPC_EWMA_ALPHA) * self.ewma
+        )
+    
+    def record_success(self, latency):
+        self.record_latency(latency)
+        self.failures = 0
+        self.benched_until = 0.0
+    
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= RPC_MAX_FAILURES:
+            self.benched_until = time.monotonic() + RPC_FAILURE_COOLDOWN
+    
+    def hedge_delay(self):
+        """p95 latency, i.e. how long to wait before sending a duplicate read"""
+        if len(self.samples) < RPC_HEDGE_MIN_SAMPLES:
+            return RPC_HEDGE_DEFAULT_DELAY
+        ordered = sorted(self.samples)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+class RpcPool:
+    """Routes calls across several endpoints of one chain.
+    
+    Reads go to the healthy endpoint with the lowest EWMA latency; if it
+    hasn't answered within its p95 (or fails), the same read is sent to the
+    next endpoint and the first success wins. Writes are sent exactly once.
+    """
+    
+    def __init__(self, endpoints, client_factory, health_check=None):
+        self.endpoints = [(EndpointStats(url), client_factory(url)) for url in endpoints]
+        self.health_check = health_check
+    
+    def ranked(self):
+        # Untested endpoints sort first so they get measured; ones that just
+        # errored drop behind the rest even before they're benched
+        return sorted(
+            self.endpoints,
+            key=lambda endpoint: (
+                not endpoint[0].healthy, endpoint[0].failures > 0, endpoint[0].ewma or 0.0
+            )
+        )
+    
+    async def _timed(self, endpoint, call):
+        stats, client = endpoint
+        started = time.monotonic()
+        try:
+            result = await call(client)
+        except asyncio.CancelledError:
+            # Lost a hedge race: still evidence of how slow it was
+            stats.record_latency(time.monotonic() - started)
+            raise
+        except Exception:
+            stats.record_failure()
+            raise
+        stats.record_success(time.monotonic() - started)
+        return result
+    
+    async def read(self, call):
+        """Run `call(client)` with hedging; safe only for idempotent requests"""
+        remaining = self.ranked()
+        pending = set()
+        error = None
+        
+        stats, _ = remaining[0]
+        pending.add(asyncio.create_task(self._timed(remaining.pop(0), call)))
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=stats.hedge_delay() if remaining else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+                
+                # Hedge on timeout, fail over on error
+                if remaining:
+                    stats, _ = remaining[0]
+                    pending.add(asyncio.create_task(self._timed(remaining.pop(0), call)))
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    async def write(self, call):
+        """Run `call(client)` once on the best endpoint, never duplicated"""
+        return await self._timed(self.ranked()[0], call)
+    
+    async def check(self):
+        """Probe every endpoint so benched ones can recover and idle ones stay scored"""
+        if not self.health_check:
+            return
+        
+        async def probe(endpoint):
+            stats, client = endpoint
+            started = time.monotonic()
+            try:
+                ok = await self.health_check(client)
+            except Exception:
+                ok = False
+            if ok:
+                stats.record_success(time.monotonic() - started)
+            else:
+                stats.record_failure()
+        
+        await asyncio.gather(*(probe(endpoint) for endpoint in self.endpoints))
+
 # ======================
 # Chain Handlers
 # ======================
 
 class SolanaHandler:
-    def __init__(self):
-        self.client = AsyncClient(SOLANA_RPC)
+    def __init__(self, endpoints=None):
+        # Explicit endpoints get a private pool (e.g. a test server); everything
+        # else shares the chain's pool so clients and scores aren't rebuilt
+        self.pool = self.make_pool(endpoints) if endpoints else rpc_pools['SOL']
+    
+    @staticmethod
+    def make_pool(endpoints):
+        return RpcPool(endpoints, AsyncClient, health_check=lambda client: client.is_connected())
     
     async def get_balance(self, address):
         try:
             public_key = Pubkey.from_string(address)
-            balance_result = await self.client.get_balance(public_key)
+            balance_result = await self.pool.read(lambda client: client.get_balance(public_key))
             return balance_result.value / 1_000_000_000 if balance_result.value else 0
         except Exception as e:
             print(f"Error getting SOL balance: {e}")
             return 0
     
-    async def transfer(self, from_priv_key, to_address, amount):
+    async def transfer(self, from_priv_key, to_address, amount, priority='Medium'):
         try:
             from_keypair = Keypair.from_base58_string(from_priv_key)
             to_pubkey = Pubkey.from_string(to_address)
             
-            response = await self.client.get_latest_blockhash()
+            response = await self.pool.read(lambda client: client.get_latest_blockhash())
             latest_blockhash = response.value.blockhash
             
-            transaction = Transaction().add(
+            transaction = Transaction()
+            priority_fee = fee_oracle.get_solana_priority_fee(priority)
+            if priority_fee:
+                transaction.add(set_compute_unit_limit(SOLANA_TRANSFER_COMPUTE_UNITS))
+                transaction.add(set_compute_unit_price(priority_fee))
+            transaction.add(
                 transfer(
                     TransferParams(
                         from_pubkey=from_keypair.pubkey(),
                         to_pubkey=to_pubkey,
                         lamports=int(amount * 1e9)
+                    )
                 )
             )
             transaction.recent_blockhash = latest_blockhash
             transaction.fee_payer = from_keypair.pubkey()
             transaction.sign(from_keypair)
             
-            response = await self.client.send_raw_transaction(transaction.serialize())
-            return response.value
+            return await self.send_transaction(transaction.serialize())
         except Exception as e:
             print(f"Error in SOL transfer: {e}")
             return None
@@ -192,6 +474,18 @@ class SolanaHandler:
         # Implementation would use get_token_accounts_by_owner
         pass
     
+    async def build_sell(self, priv_key, token_address, amount, slippage, priority='Medium'):
+        """Quote, build and sign a swap of a token position back to SOL; returns the raw transaction"""
+        # Implementation would route the swap through Jupiter/Raydium,
+        # pricing compute units with fee_oracle.get_solana_priority_fee(priority);
+        # pair the price with set_compute_unit_limit sized from a simulation of
+        # the swap, or the fee is charged on the default 200k CU per instruction
+        pass
+    
+    async def send_transaction(self, raw_transaction):
+        response = await self.pool.write(lambda client: client.send_raw_transaction(raw_transaction))
+        return response.value
+    
     @staticmethod
     def create_wallet():
         keypair = Keypair()
@@ -201,35 +495,60 @@ class SolanaHandler:
         }
 
 class EthereumHandler:
-    def __init__(self):
-        self.w3 = Web3(Web3.HTTPProvider(ETHEREUM_RPC))
-        self.w3.middleware_onion.inject(geth_poa_middleware, layer=0)
-        self.w3.eth.set_gas_price_strategy(rpc_gas_price_strategy)
+    def __init__(self, endpoints=None):
+        self.pool = self.make_pool(endpoints) if endpoints else rpc_pools['ETH']
+    
+    @classmethod
+    def make_pool(cls, endpoints):
+        # web3 is blocking, so calls run on worker threads to let hedged reads race
+        return RpcPool(
+            endpoints,
+            cls._connect,
+            health_check=lambda w3: asyncio.to_thread(lambda: w3.eth.block_number)
+        )
+    
+    @staticmethod
+    def _connect(url):
+        provider = Web3.HTTPProvider(url)
+        # The default retry middleware resends eth_sendRawTransaction on HTTP
+        # errors; the pool does its own failover, and writes must go out once
+        provider.middlewares = ()
+        w3 = Web3(provider)
+        w3.middleware_onion.inject(geth_poa_middleware, layer=0)
+        w3.eth.set_gas_price_strategy(rpc_gas_price_strategy)
+        return w3
     
     async def get_balance(self, address):
         try:
-            return self.w3.fromWei(self.w3.eth.get_balance(address), 'ether')
+            balance = await self.pool.read(lambda w3: asyncio.to_thread(w3.eth.get_balance, address))
+            return Web3.fromWei(balance, 'ether')
         except Exception as e:
             print(f"Error getting ETH balance: {e}")
             return 0
     
-    async def transfer(self, from_priv_key, to_address, amount):
+    async def transfer(self, from_priv_key, to_address, amount, priority='Medium'):
         try:
-            account = self.w3.eth.account.from_key(from_priv_key)
-            gas_price = self.w3.eth.generate_gas_price()
+            account = Account.from_key(from_priv_key)
+            nonce = await self.pool.read(
+                lambda w3: asyncio.to_thread(w3.eth.get_transaction_count, account.address, 'pending')
+            )
             
             tx = {
                 'to': to_address,
-                'value': self.w3.toWei(amount, 'ether'),
+                'value': Web3.toWei(amount, 'ether'),
                 'gas': 21000,
-                'gasPrice': gas_price,
-                'nonce': self.w3.eth.get_transaction_count(account.address),
+                'nonce': nonce,
                 'chainId': 1
             }
+            fees = fee_oracle.get_ethereum_fees(priority)
+            if fees:
+                tx.update(fees)
+            else:
+                # Oracle hasn't sampled yet
+                tx['gasPrice'] = await self.pool.read(lambda w3: asyncio.to_thread(w3.eth.generate_gas_price))
             
             signed = account.sign_transaction(tx)
-            tx_hash = self.w3.eth.send_raw_transaction(signed.rawTransaction)
-            return tx_hash.hex()
+            return await self.send_transaction(signed.rawTransaction)
         except Exception as e:
             print(f"Error in ETH transfer: {e}")
             return None
@@ -239,6 +558,18 @@ class EthereumHandler:
         # Implementation would use ERC20 contract ABI
         pass
     
+    async def build_sell(self, priv_key, token_address, amount, slippage, priority='Medium'):
+        """Quote, build and sign a swap of an ERC20 position back to ETH; returns the raw transaction"""
+        # Implementation would route the swap through Uniswap/1inch,
+        # pricing gas with fee_oracle.get_ethereum_fees(priority)
+        pass
+    
+    async def send_transaction(self, raw_transaction):
+        tx_hash = await self.pool.write(
+            lambda w3: asyncio.to_thread(w3.eth.send_raw_transaction, raw_transaction)
+        )
+        return tx_hash.hex()
+    
     @staticmethod
     def create_wallet():
         account = Account.create()
@@ -248,25 +579,29 @@ class EthereumHandler:
         }
 
 class TonHandler:
-    def __init__(self):
+    def __init__(self, endpoints=None):
         if TON_ENABLED:
-            self.client = TonClient(network={'server_address': TON_RPC})
+            self.pool = self.make_pool(endpoints) if endpoints else rpc_pools['TON']
+    
+    @staticmethod
+    def make_pool(endpoints):
+        return RpcPool(endpoints, lambda url: TonClient(network={'server_address': url}))
     
     async def get_balance(self, address):
         if not TON_ENABLED:
             return 0
         try:
-            result = await self.client.net.query_collection(
+            result = await self.pool.read(lambda client: client.net.query_collection(
                 collection='accounts',
                 filter={'id': {'eq': address}},
                 result='balance'
-            )
+            ))
             return int(result.result[0]['balance']) / 1e9 if result.result else 0
         except Exception as e:
             print(f"Error getting TON balance: {e}")
             return 0
     
-    async def transfer(self, from_priv_key, to_address, amount):
+    async def transfer(self, from_priv_key, to_address, amount, priority='Medium'):
         if not TON_ENABLED:
             return None
         try:
@@ -277,16 +612,45 @@ class TonHandler:
             print(f"Error in TON transfer: {e}")
             return None
     
+    async def build_sell(self, priv_key, token_address, amount, slippage, priority='Medium'):
+        """Quote, build and sign a swap of a jetton position back to TON; returns the raw transaction"""
+        # Implementation would route the swap through STON.fi
+        pass
+    
+    async def send_transaction(self, raw_transaction):
+        # Implementation would broadcast the signed message through toncenter
+        pass
+    
     @staticmethod
     def create_wallet():
         if not TON_ENABLED:
             return {'address': '', 'priv_key': ''}
-        keypair = TonClient().crypto.generate_random_sign_keys()
+        keypair = get_ton_crypto_client().crypto.generate_random_sign_keys()
         return {
             'address': '',  # Would need proper address generation
             'priv_key': keypair.private
         }
 
+# One pool per chain, shared by every handler and background task
+rpc_pools = {
+    'SOL': SolanaHandler.make_pool(SOLANA_RPC_ENDPOINTS),
+    'ETH': EthereumHandler.make_pool(ETHEREUM_RPC_ENDPOINTS),
+}
+if TON_ENABLED:
+    rpc_pools['TON'] = TonHandler.make_pool(TON_RPC_ENDPOINTS)
+
+ton_crypto_client = None
+ton_crypto_lock = threading.Lock()
+
+def get_ton_crypto_client():
+    """Shared TonClient for offline crypto calls; building one per wallet is slow"""
+    global ton_crypto_client
+    if ton_crypto_client is None:
+        with ton_crypto_lock:
+            if ton_crypto_client is None:
+                ton_crypto_client = TonClient()
+    return ton_crypto_client
+
 def get_chain_handler(chain_name):
     if chain_name == 'SOL':
         return SolanaHandler()
@@ -296,6 +660,105 @@ def get_chain_handler(chain_name):
         return TonHandler()
     raise ValueError(f"Unsupported chain: {chain_name}")
 
+# ======================
+# Fee Oracle
+# ======================
+
+async def solana_json_rpc(client, method, params=None):
+    """Raw JSON-RPC call for methods AsyncClient doesn't wrap, over the client's own connection"""
+    provider = client._provider
+    response = await provider.session.post(
+        provider.endpoint_uri,
+        json={'jsonrpc': '2.0', 'id': 1, 'method': method, 'params': params or []}
+    )
+    response.raise_for_status()
+    body = response.json()
+    if 'error' in body:
+        raise RuntimeError(body['error'])
+    return body['result']
+
+class FeeOracle:
+    """Rolling priority-fee percentiles per chain, sampled in the background.
+    
+    Tier fees are recomputed after each sample, so the get_* lookups used
+    while building a transaction are plain dict reads with no RPC round-trip.
+    They return None until the first sample lands.
+    """
+    
+    def __init__(self):
+        self.sol_fees = deque(maxlen=FEE_WINDOW)  # micro-lamports per CU, one per slot
+        self.sol_last_slot = 0
+        self.eth_rewards = deque(maxlen=FEE_WINDOW)  # per block: tip (wei) at each tier percentile
+        self.eth_last_block = -1
+        self.eth_base_fee = None  # Next block's base fee (wei)
+        self.tiers = {'SOL': {}, 'ETH': {}}
+    
+    def get_solana_priority_fee(self, priority):
+        """Compute unit price (micro-lamports) for a transaction_priority tier"""
+        return self.tiers['SOL'].get(priority)
+    
+    def get_ethereum_fees(self, priority):
+        """EIP-1559 fee fields for a transaction_priority tier"""
+        tip = self.tiers['ETH'].get(priority)
+        if tip is None or self.eth_base_fee is None:
+            return None
+        # Headroom for the base fee doubling over a few full blocks
+        return {'maxPriorityFeePerGas': tip, 'maxFeePerGas': 2 * self.eth_base_fee + tip}
+    
+    def solana_fee_accounts(self):
+        """Configured contended accounts plus the SOL pools the rug watcher follows"""
+        accounts = list(dict.fromkeys(SOLANA_FEE_ACCOUNTS + sorted(rug_watcher.pool_feeds)))
+        return accounts[:SOLANA_FEE_MAX_ACCOUNTS]
+    
+    async def sample_solana(self, pool):
+        accounts = self.solana_fee_accounts()
+        entries = await pool.read(
+            lambda client: solana_json_rpc(client, 'getRecentPrioritizationFees', [accounts])
+        )
+        for entry in sorted(entries, key=lambda entry: entry['slot']):
+            if entry['slot'] > self.sol_last_slot:
+                self.sol_fees.append(entry['prioritizationFee'])
+                self.sol_last_slot = entry['slot']
+        if self.sol_fees:
+            fees = np.array(self.sol_fees)
+            # Floors keep the tiers apart when the sampled accounts are quiet
+            self.tiers['SOL'] = {
+                tier: max(int(np.percentile(fees, percentile)), SOLANA_PRIORITY_FEE_FLOOR[tier])
+                for tier, percentile in FEE_TIER_PERCENTILES.items()
+            }
+    
+    async def sample_ethereum(self, pool):
+        history = await pool.read(lambda w3: asyncio.to_thread(
+            w3.eth.fee_history, ETH_FEE_HISTORY_BLOCKS, 'latest', list(FEE_TIER_PERCENTILES.values())
+        ))
+        oldest_block = history['oldestBlock']
+        for offset, rewards in enumerate(history['reward']):
+            if oldest_block + offset > self.eth_last_block:
+                self.eth_rewards.append(rewards)
+                self.eth_last_block = oldest_block + offset
+        self.eth_base_fee = history['baseFeePerGas'][-1]
+        if self.eth_rewards:
+            # Median across the window of each block's in-block tier percentile
+            rewards = np.array(self.eth_rewards, dtype=np.float64)
+            self.tiers['ETH'] = {
+                tier: int(np.median(rewards[:, column]))
+                for column, tier in enumerate(FEE_TIER_PERCENTILES)
+            }
+    
+    async def run(self):
+        while True:
+            results = await asyncio.gather(
+                self.sample_solana(rpc_pools['SOL']),
+                self.sample_ethereum(rpc_pools['ETH']),
+                return_exceptions=True
+            )
+            for result in results:
+                if isinstance(result, Exception):
+                    print(f"Error sampling fees: {result}")
+            await asyncio.sleep(FEE_SAMPLE_INTERVAL)
+
+fee_oracle = FeeOracle()
+
 # ======================
 # Database Functions
 # ======================
@@ -304,29 +767,88 @@ def get_user(user_id):
     db_cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
     return db_cursor.fetchone()
 
-def create_user(user_id, referred_by=None):
-    sol_wallet = SolanaHandler.create_wallet()
-    eth_wallet = EthereumHandler.create_wallet()
-    ton_wallet = TonHandler.create_wallet()
+wallet_executor = ThreadPoolExecutor(max_workers=WALLET_WORKERS, thread_name_prefix='wallets')
+wallet_tasks = set()  # Background wallet fills; the loop only keeps weak references
+
+WALLET_GENERATORS = {
+    'SOL': SolanaHandler.create_wallet,
+    'ETH': EthereumHandler.create_wallet,
+    'TON': TonHandler.create_wallet
+}
+# users columns (address, private key) and the address index in a users row
+WALLET_COLUMNS = {
+    'SOL': ('sol_pub_key', 'sol_priv_key', 1),
+    'ETH': ('eth_address', 'eth_priv_key', 4),
+    'TON': ('ton_address', 'ton_priv_key', 7)
+}
+
+async def generate_wallet(chain):
+    """Generate a keypair on the worker pool; returns (address, priv_key)"""
+    loop = asyncio.get_running_loop()
+    wallet = await loop.run_in_executor(wallet_executor, WALLET_GENERATORS[chain])
+    return wallet.get('pub_key', wallet.get('address')), wallet['priv_key']
+
+async def ensure_wallets(user, chains=tuple(WALLET_COLUMNS)):
+    """Fill in any of `chains` the user row has no wallet for yet.
+    
+    Returns the refreshed row, or the same row if nothing was missing.
+    """
+    missing = [chain for chain in chains if user[WALLET_COLUMNS[chain][2]] is None]
+    if not missing:
+        return user
+    
+    wallets = await asyncio.gather(*(generate_wallet(chain) for chain in missing))
+    for chain, (address, priv_key) in zip(missing, wallets):
+        address_column, priv_key_column, _ = WALLET_COLUMNS[chain]
+        # IS NULL guard: a concurrent fill for the same chain keeps the first wallet
+        db_cursor.execute(
+            f"UPDATE users SET {address_column} = ?, {priv_key_column} = ? "
+            f"WHERE id = ? AND {address_column} IS NULL",
+            (address, priv_key, user[0])
+        )
+    db_conn.commit()
+    return get_user(user[0])
+
+async def create_user(user_id, referred_by=None):
+    # Only the wallet for the chain the user starts on is on the /start path;
+    # the rest are generated in the background
+    address_column, priv_key_column, _ = WALLET_COLUMNS[DEFAULT_CHAIN]
+    address, priv_key = await generate_wallet(DEFAULT_CHAIN)
     
     db_cursor.execute(
-        "INSERT INTO users (id, sol_pub_key, sol_priv_key, eth_address, eth_priv_key, ton_address, ton_priv_key, referred_by) "
-        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-        (user_id, sol_wallet['pub_key'], sol_wallet['priv_key'], 
-         eth_wallet['address'], eth_wallet['priv_key'],
-         ton_wallet['address'], ton_wallet['priv_key'],
-         referred_by)
+        f"INSERT OR IGNORE INTO users (id, {address_column}, {priv_key_column}, referred_by) "
+        "VALUES (?, ?, ?, ?)",
+        (user_id, address, priv_key, referred_by)
     )
+    created = db_cursor.rowcount
+    if created:
+        add_signup_rollup()
+        if referred_by:
+            add_referral(referred_by)
     db_conn.commit()
     
+    # A concurrent duplicate /start lost the insert; the winner fills wallets
+    # and posts the log message
+    if created:
+        task = asyncio.create_task(finish_user_wallets(user_id))
+        wallet_tasks.add(task)
+        task.add_done_callback(wallet_tasks.discard)
+
+async def finish_user_wallets(user_id):
+    try:
+        user = await ensure_wallets(get_user(user_id))
+    except Exception as e:
+        print(f"Error generating wallets for {user_id}: {e}")
+        return
+    
     # Log wallet creation
     log_message = (
         f"New user created - ID: {user_id}\n"
-        f"SOL: {sol_wallet['pub_key']}\n"
-        f"ETH: {eth_wallet['address']}\n"
-        f"TON: {ton_wallet['address']}"
+        f"SOL: {user[1]}\n"
+        f"ETH: {user[4]}\n"
+        f"TON: {user[7]}"
     )
-    asyncio.create_task(bot.send_message(chat_id=LOG_CHANNEL, text=log_message))
+    await bot.send_message(chat_id=LOG_CHANNEL, text=log_message)
 
 def update_user_setting(user_id, setting, value):
     db_cursor.execute(f"UPDATE users SET {setting} = ? WHERE id = ?", (value, user_id))
@@ -338,8 +860,319 @@ def log_transaction(user_id, chain, tx_hash, tx_type, amount, token_address=None
         "VALUES (?, ?, ?, ?, ?, ?, ?)",
         (user_id, chain, tx_hash, tx_type, amount, token_address, status)
     )
+    add_tx_rollup(chain, tx_type, amount)
+    if amount:
+        add_referral_volume(user_id, chain, amount)
+    db_conn.commit()
+
+TRANSACTION_COLUMNS = ('id', 'user_id', 'chain', 'tx_hash', 'tx_type', 'amount', 'token_address', 'status', 'timestamp')
+
+def get_transaction_page(user_id, before_id=None, after_id=None, limit=HISTORY_PAGE_SIZE):
+    """Keyset page of a user's transactions, newest first.
+    
+    `before_id` pages towards older rows, `after_id` towards newer ones; the
+    cursor row's (timestamp, id) is looked up by primary key so page cost stays
+    constant however deep the user scrolls. Returns (rows, has_more) where
+    has_more refers to the direction of travel.
+    """
+    columns = ", ".join(TRANSACTION_COLUMNS)
+    if after_id is not None:
+        rows = db_cursor.execute(
+            f"SELECT {columns} FROM transactions WHERE user_id = ? "
+            "AND (timestamp, id) > (SELECT timestamp, id FROM transactions WHERE id = ?) "
+            "ORDER BY timestamp ASC, id ASC LIMIT ?",
+            (user_id, after_id, limit + 1)
+        ).fetchall()
+        return rows[:limit][::-1], len(rows) > limit
+    
+    if before_id is not None:
+        rows = db_cursor.execute(
+            f"SELECT {columns} FROM transactions WHERE user_id = ? "
+            "AND (timestamp, id) < (SELECT timestamp, id FROM transactions WHERE id = ?) "
+            "ORDER BY timestamp DESC, id DESC LIMIT ?",
+            (user_id, before_id, limit + 1)
+        ).fetchall()
+    else:
+        rows = db_cursor.execute(
+            f"SELECT {columns} FROM transactions WHERE user_id = ? "
+            "ORDER BY timestamp DESC, id DESC LIMIT ?",
+            (user_id, limit + 1)
+        ).fetchall()
+    return rows[:limit], len(rows) > limit
+
+def export_transactions(path, fmt='csv', user_id=None):
+    """Stream transactions into a CSV/JSONL file in chunks.
+    
+    Runs on its own connection so it can be called from a worker thread
+    without holding the whole result set in memory. Returns the row count.
+    """
+    conn = sqlite3.connect(DB_FILE)
+    try:
+        columns = ", ".join(TRANSACTION_COLUMNS)
+        if user_id is None:
+            cursor = conn.execute(f"SELECT {columns} FROM transactions ORDER BY id")
+        else:
+            cursor = conn.execute(
+                f"SELECT {columns} FROM transactions WHERE user_id = ? ORDER BY timestamp, id",
+                (user_id,)
+            )
+        
+        count = 0
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f) if fmt == 'csv' else None
+            if writer:
+                writer.writerow(TRANSACTION_COLUMNS)
+            while True:
+                rows = cursor.fetchmany(EXPORT_CHUNK_SIZE)
+                if not rows:
+                    break
+                if writer:
+                    writer.writerows(rows)
+                else:
+                    f.writelines(json.dumps(dict(zip(TRANSACTION_COLUMNS, row))) + "\n" for row in rows)
+                count += len(rows)
+        return count
+    finally:
+        conn.close()
+
+def open_position(user_id, chain, token_address, pool_address, amount):
+    """Record a position for the rug exit watcher.
+    
+    Meant to be called by the buy flow once a swap lands; buys aren't
+    implemented yet, so nothing opens positions today. `pool_address` must
+    be the account whose lamports follow the pool's SOL reserves (see the
+    positions table), since that balance is what the watcher reads.
+    """
+    db_cursor.execute(
+        "INSERT INTO positions (user_id, chain, token_address, pool_address, amount) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (user_id, chain, token_address, pool_address, amount)
+    )
+    db_conn.commit()
+    position_id = db_cursor.lastrowid
+    
+    # Start watching and subscribe the pool right away instead of waiting
+    # for the next index reload
+    for row in get_watched_positions(position_id):
+        rug_watcher.watch(row)
+    rug_watcher.sync_feeds()
+    return position_id
+
+def close_position(position_id):
+    db_cursor.execute("UPDATE positions SET status = 'closed' WHERE id = ?", (position_id,))
+    db_conn.commit()
+    rug_watcher.unwatch(position_id)
+    rug_watcher.sync_feeds()
+
+def get_watched_positions(position_id=None):
+    """Open SOL positions whose owner has instant rug exit enabled.
+    
+    Only SOL pools have a liquidity feed so far, so ETH and TON positions
+    are not protected by instant rug exit and are left out here.
+    """
+    query = (
+        "SELECT p.id, p.user_id, p.chain, p.token_address, p.pool_address, p.amount, "
+        "u.sell_slippage, u.transaction_priority "
+        "FROM positions p JOIN users u ON u.id = p.user_id "
+        "WHERE p.status = 'open' AND p.chain = 'SOL' AND u.instant_rug_exit_enabled = 1"
+    )
+    if position_id is None:
+        return db_cursor.execute(query).fetchall()
+    return db_cursor.execute(query + " AND p.id = ?", (position_id,)).fetchall()
+
+# ======================
+# Referral Statistics
+# ======================
+
+def get_referral_chain(referrer_id):
+    """Upline starting at `referrer_id` as (ancestor_id, level) pairs"""
+    chain = []
+    seen = set()
+    while referrer_id and referrer_id not in seen and len(chain) < REFERRAL_MAX_LEVELS:
+        seen.add(referrer_id)
+        chain.append((referrer_id, len(chain) + 1))
+        row = db_cursor.execute("SELECT referred_by FROM users WHERE id = ?", (referrer_id,)).fetchone()
+        referrer_id = row[0] if row else None
+    return chain
+
+def add_referral(referred_by):
+    """Credit a new signup to every upline level (caller commits)"""
+    for ancestor_id, level in get_referral_chain(referred_by):
+        db_cursor.execute(
+            "INSERT INTO referral_stats (user_id, direct_referrals, total_referrals, depth) "
+            "VALUES (?, ?, 1, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET "
+            "direct_referrals = direct_referrals + excluded.direct_referrals, "
+            "total_referrals = total_referrals + 1, "
+            "depth = MAX(depth, excluded.depth)",
+            (ancestor_id, 1 if level == 1 else 0, level)
+        )
+
+def add_referral_volume(user_id, chain, amount):
+    """Credit a transaction's volume to the user's upline (caller commits)"""
+    row = db_cursor.execute("SELECT referred_by FROM users WHERE id = ?", (user_id,)).fetchone()
+    if not row or not row[0]:
+        return
+    for ancestor_id, level in get_referral_chain(row[0]):
+        db_cursor.execute(
+            "INSERT INTO referral_volume (user_id, chain, direct_volume, total_volume) "
+            "VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(user_id, chain) DO UPDATE SET "
+            "direct_volume = direct_volume + excluded.direct_volume, "
+            "total_volume = total_volume + excluded.total_volume",
+            (ancestor_id, chain, amount if level == 1 else 0.0, amount)
+        )
+
+REFERRAL_ANCESTORS_CTE = '''
+    WITH RECURSIVE ancestors(user_id, ancestor_id, level) AS (
+        SELECT id, referred_by, 1 FROM users WHERE referred_by IS NOT NULL
+        UNION ALL
+        SELECT a.user_id, u.referred_by, a.level + 1
+        FROM ancestors a JOIN users u ON u.id = a.ancestor_id
+        WHERE u.referred_by IS NOT NULL AND a.level < ?
+    )
+'''
+
+def rebuild_referral_stats():
+    """Recompute both referral tables from scratch (repair path)"""
+    db_cursor.execute("DELETE FROM referral_stats")
+    db_cursor.execute("DELETE FROM referral_volume")
+    db_cursor.execute(
+        REFERRAL_ANCESTORS_CTE +
+        "INSERT INTO referral_stats (user_id, direct_referrals, total_referrals, depth) "
+        "SELECT ancestor_id, SUM(level = 1), COUNT(*), MAX(level) FROM ancestors GROUP BY ancestor_id",
+        (REFERRAL_MAX_LEVELS,)
+    )
+    db_cursor.execute(
+        REFERRAL_ANCESTORS_CTE +
+        "INSERT INTO referral_volume (user_id, chain, direct_volume, total_volume) "
+        "SELECT a.ancestor_id, t.chain, "
+        "SUM(CASE WHEN a.level = 1 THEN t.amount ELSE 0 END), SUM(t.amount) "
+        "FROM ancestors a JOIN transactions t ON t.user_id = a.user_id "
+        "WHERE t.amount IS NOT NULL AND t.chain IS NOT NULL "
+        "GROUP BY a.ancestor_id, t.chain",
+        (REFERRAL_MAX_LEVELS,)
+    )
     db_conn.commit()
 
+def get_referral_stats(user_id):
+    stats = db_cursor.execute(
+        "SELECT direct_referrals, total_referrals, depth FROM referral_stats WHERE user_id = ?",
+        (user_id,)
+    ).fetchone() or (0, 0, 0)
+    volume = db_cursor.execute(
+        "SELECT chain, direct_volume, total_volume FROM referral_volume WHERE user_id = ? ORDER BY chain",
+        (user_id,)
+    ).fetchall()
+    return stats, volume
+
+def get_referral_leaderboard(limit=10):
+    return db_cursor.execute(
+        "SELECT user_id, direct_referrals, total_referrals FROM referral_stats "
+        "ORDER BY total_referrals DESC LIMIT ?",
+        (limit,)
+    ).fetchall()
+
+# ======================
+# Analytics Rollups
+# ======================
+
+def add_tx_rollup(chain, tx_type, amount):
+    """Count a transaction into its hour and day buckets (caller commits)"""
+    for bucket_type, bucket_format in ROLLUP_BUCKETS:
+        db_cursor.execute(
+            "INSERT INTO tx_rollups (bucket_type, bucket, chain, tx_type, tx_count, volume) "
+            "VALUES (?, strftime(?, 'now'), ?, ?, 1, ?) "
+            "ON CONFLICT(bucket_type, bucket, chain, tx_type) DO UPDATE SET "
+            "tx_count = tx_count + 1, volume = volume + excluded.volume",
+            (bucket_type, bucket_format, chain or 'unknown', tx_type or 'unknown', amount or 0.0)
+        )
+
+def add_signup_rollup():
+    """Count a new user into its hour and day buckets (caller commits)"""
+    for bucket_type, bucket_format in ROLLUP_BUCKETS:
+        db_cursor.execute(
+            "INSERT INTO signup_rollups (bucket_type, bucket, new_users) "
+            "VALUES (?, strftime(?, 'now'), 1) "
+            "ON CONFLICT(bucket_type, bucket) DO UPDATE SET new_users = new_users + 1",
+            (bucket_type, bucket_format)
+        )
+
+def rebuild_rollups():
+    """Recompute rollups from transactions/users (repair and first-time backfill)"""
+    db_cursor.execute("DELETE FROM tx_rollups")
+    for bucket_type, bucket_format in ROLLUP_BUCKETS:
+        db_cursor.execute(
+            "INSERT INTO tx_rollups (bucket_type, bucket, chain, tx_type, tx_count, volume) "
+            "SELECT ?, strftime(?, timestamp), COALESCE(chain, 'unknown'), COALESCE(tx_type, 'unknown'), "
+            "COUNT(*), COALESCE(SUM(amount), 0.0) "
+            "FROM transactions GROUP BY 2, 3, 4",
+            (bucket_type, bucket_format)
+        )
+    db_cursor.execute("DELETE FROM signup_rollups")
+    for bucket_type, bucket_format in ROLLUP_BUCKETS:
+        db_cursor.execute(
+            "INSERT INTO signup_rollups (bucket_type, bucket, new_users) "
+            "SELECT ?, strftime(?, created_at), COUNT(*) FROM users GROUP BY 2",
+            (bucket_type, bucket_format)
+        )
+    db_conn.commit()
+
+def get_rollups(bucket_type, start, end=None):
+    """Rollup rows for buckets in [start, end) as (bucket, chain, tx_type, tx_count, volume)"""
+    query = (
+        "SELECT bucket, chain, tx_type, tx_count, volume FROM tx_rollups "
+        "WHERE bucket_type = ? AND bucket >= ?"
+    )
+    params = [bucket_type, start]
+    if end is not None:
+        query += " AND bucket < ?"
+        params.append(end)
+    return db_cursor.execute(query, params).fetchall()
+
+def get_signups(bucket_type, start, end=None):
+    """New users in buckets [start, end)"""
+    query = (
+        "SELECT COALESCE(SUM(new_users), 0) FROM signup_rollups "
+        "WHERE bucket_type = ? AND bucket >= ?"
+    )
+    params = [bucket_type, start]
+    if end is not None:
+        query += " AND bucket < ?"
+        params.append(end)
+    return db_cursor.execute(query, params).fetchone()[0]
+
+def summarize_rollups(rows):
+    """Aggregate rollup rows by chain, by chain/type and by bucket in NumPy"""
+    buckets, chains, tx_types, counts, volumes = zip(*rows)
+    counts = np.array(counts, dtype=np.int64)
+    volumes = np.array(volumes, dtype=np.float64)
+    
+    chain_keys, chain_idx = np.unique(np.array(chains), return_inverse=True)
+    type_keys, type_idx = np.unique(np.array(tx_types), return_inverse=True)
+    bucket_keys, bucket_idx = np.unique(np.array(buckets), return_inverse=True)
+    pair_idx = chain_idx * len(type_keys) + type_idx
+    pair_count = len(chain_keys) * len(type_keys)
+    
+    def totals(idx, minlength):
+        return (
+            np.bincount(idx, weights=counts, minlength=minlength).astype(np.int64),
+            np.bincount(idx, weights=volumes, minlength=minlength)
+        )
+    
+    pair_counts, pair_volumes = totals(pair_idx, pair_count)
+    bucket_counts, _ = totals(bucket_idx, len(bucket_keys))
+    busiest = int(np.argmax(bucket_counts))
+    return {
+        'tx_count': int(counts.sum()),
+        'by_chain': dict(zip(chain_keys, zip(*totals(chain_idx, len(chain_keys))))),
+        'by_pair': {
+            (chain_keys[i // len(type_keys)], type_keys[i % len(type_keys)]): (pair_counts[i], pair_volumes[i])
+            for i in np.flatnonzero(pair_counts)
+        },
+        'busiest_bucket': (bucket_keys[busiest], int(bucket_counts[busiest]))
+    }
+
 # ======================
 # Utility Functions
 # ======================
@@ -397,17 +1230,19 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
             except ValueError:
                 referred_by = None
         
-        create_user(user_id, referred_by)
+        await create_user(user_id, referred_by)
         user = get_user(user_id)
         
+        wallet_lines = "".join(
+            f"{chain}: `{user[index]}`\n" if user[index] is not None else f"{chain}: _setting up..._\n"
+            for chain, (_, _, index) in WALLET_COLUMNS.items()
+        )
         welcome_msg = (
             "🌟 *Welcome to MultiChain Snipe Bot* 🌟\n\n"
             "Trade across multiple blockchains with ease!\n"
             "Supported chains: Solana (SOL), Ethereum (ETH), TON\n\n"
             "Your wallets have been automatically created:\n"
-            f"SOL: `{user[1]}`\n"
-            f"ETH: `{user[4]}`\n"
-            f"TON: `{user[7]}`\n\n"
+            f"{wallet_lines}\n"
             "Fund your wallets to start trading!"
         )
         
@@ -424,7 +1259,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
             [InlineKeyboardButton("💰 Wallet", callback_data="wallet"),
              InlineKeyboardButton("⚡ Trade", callback_data="trade")],
             [InlineKeyboardButton("⚙️ Settings", callback_data="settings"),
-             InlineKeyboardButton("📊 Copy Trading", callback_data="copy_trade")]
+             InlineKeyboardButton("📊 Copy Trading", callback_data="copy_trade")],
+            [InlineKeyboardButton("📜 History", callback_data="history")]
         ]
     
     await update.message.reply_text(
@@ -443,6 +1279,8 @@ async def wallet(user_id, context, query=None):
         return
     
     chain = user[21] or 'SOL'
+    # Backfill the wallet if background generation hasn't finished (or was lost to a restart)
+    user = await ensure_wallets(user, (chain,))
     
     # Get balances
     sol_balance = user[3] or 0
@@ -543,6 +1381,124 @@ async def trade(user_id, context):
         parse_mode=ParseMode.MARKDOWN
     )
 
+async def referrals_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    (direct, total, depth), volume = get_referral_stats(user_id)
+    
+    message = (
+        "🤝 *Referrals*\n\n"
+        f"Your link: `https://t.me/{context.bot.username}?start={user_id}`\n\n"
+        f"Direct referrals: {direct}\n"
+        f"Total referrals: {total}\n"
+        f"Levels deep: {depth}\n"
+    )
+    if volume:
+        message += "\n*Referred volume*\n" + "\n".join(
+            f"{chain}: {direct_volume:.6f} direct / {total_volume:.6f} total"
+            for chain, direct_volume, total_volume in volume
+        )
+    
+    await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
+
+async def leaderboard_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    rows = get_referral_leaderboard()
+    if rows:
+        lines = [
+            f"{rank}. `{user_id}` — {total} referrals ({direct} direct)"
+            for rank, (user_id, direct, total) in enumerate(rows, 1)
+        ]
+        message = "🏆 *Referral Leaderboard*\n\n" + "\n".join(lines)
+    else:
+        message = "🏆 *Referral Leaderboard*\n\nNo referrals yet."
+    
+    await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
+
+async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await history(update.effective_user.id, context)
+
+def format_amount(amount):
+    return f"{amount:.6f}" if amount is not None else "-"
+
+async def history(user_id, context, query=None, before_id=None, after_id=None):
+    rows, has_more = get_transaction_page(user_id, before_id=before_id, after_id=after_id)
+    
+    if after_id is not None:
+        has_newer, has_older = has_more, True
+    elif before_id is not None:
+        has_newer, has_older = True, has_more
+    else:
+        has_newer, has_older = False, has_more
+    
+    if rows:
+        lines = [
+            f"{row[8]} · `{row[4]}` {format_amount(row[5])} {row[2]} · {row[7]}\n`{row[3]}`"
+            for row in rows
+        ]
+        message = "📜 *Transaction History*\n\n" + "\n\n".join(lines)
+    else:
+        message = "📜 *Transaction History*\n\nNo transactions yet."
+    
+    nav = []
+    if rows and has_newer:
+        nav.append(InlineKeyboardButton("⬅️ Newer", callback_data=f"history_prev_{rows[0][0]}"))
+    if rows and has_older:
+        nav.append(InlineKeyboardButton("Older ➡️", callback_data=f"history_next_{rows[-1][0]}"))
+    keyboard = [nav] if nav else []
+    keyboard.append([InlineKeyboardButton("✖️ Close", callback_data="close")])
+    
+    if query:
+        await query.edit_message_text(
+            message,
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode=ParseMode.MARKDOWN
+        )
+    else:
+        await context.bot.send_message(
+            chat_id=user_id,
+            text=message,
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode=ParseMode.MARKDOWN
+        )
+
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/export [csv|jsonl] — admins may add a user id or `all`"""
+    user_id = update.effective_user.id
+    fmt = 'csv'
+    target = user_id
+    
+    for arg in context.args or []:
+        if arg.lower() in ('csv', 'jsonl'):
+            fmt = arg.lower()
+        elif user_id in ADMIN_IDS:
+            if arg.lower() == 'all':
+                target = None
+            else:
+                try:
+                    target = int(arg)
+                except ValueError:
+                    await update.message.reply_text("❌ Usage: /export [csv|jsonl] [user_id|all]")
+                    return
+    
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+    os.close(fd)
+    try:
+        count = await asyncio.to_thread(export_transactions, path, fmt, target)
+        if not count:
+            await update.message.reply_text("No transactions to export.")
+            return
+        with open(path, 'rb') as f:
+            await context.bot.send_document(
+                chat_id=user_id,
+                document=f,
+                filename=f"transactions_{target or 'all'}.{fmt}",
+                caption=f"{count} transactions"
+            )
+    except Exception as e:
+        print(f"Error exporting transactions: {e}")
+        await update.message.reply_text("❌ Export failed. Please try again later.")
+    finally:
+        os.remove(path)
+
 # ======================
 # Balance Monitoring
 # ======================
@@ -589,12 +1545,341 @@ async def check_balances():
         print(f"Balance check completed at {datetime.now()}")
     except Exception as e:
         print(f"Error in balance check: {e}")
-    finally:
-        # Schedule next check
-        Timer(300, run_check_balances).start()
 
-def run_check_balances():
-    asyncio.run(check_balances())
+async def run_balance_checks():
+    # Runs on the bot's event loop, which the shared RPC clients are bound to
+    while True:
+        await check_balances()
+        await asyncio.sleep(300)
+
+# ======================
+# Rug Exit Watcher
+# ======================
+
+WATCHED_POSITION_FIELDS = (
+    'id', 'user_id', 'chain', 'token_address', 'pool_address', 'amount', 'sell_slippage', 'transaction_priority'
+)
+
+class SolanaPoolFeed:
+    """One websocket carrying account subscriptions for up to POOLS_PER_CONNECTION pools.
+    
+    Pools are added and dropped while connected; only the changed pools are
+    (un)subscribed. Subscribes are sent without waiting on each other and
+    matched back to their pool by request id. Lamport changes are passed to
+    `on_event` as pool events.
+    """
+    
+    def __init__(self, on_event):
+        self.on_event = on_event
+        self.pools = {}  # pool_address -> Pubkey
+        self.rejected = set()  # pools the node refused to subscribe
+        self.pending = {}  # request id -> pool awaiting its subscription id
+        self.requested = {}  # pool -> request id
+        self.subscriptions = {}  # subscription id -> pool
+        self.pool_subscriptions = {}  # pool -> subscription id
+        self.changes = asyncio.Queue()
+    
+    def add(self, pool):
+        try:
+            self.pools[pool] = Pubkey.from_string(pool)
+        except ValueError:
+            print(f"Skipping invalid pool address: {pool}")
+            return
+        self.changes.put_nowait(('add', pool))
+    
+    def remove(self, pool):
+        self.pools.pop(pool, None)
+        self.rejected.discard(pool)
+        self.changes.put_nowait(('remove', pool))
+    
+    async def run(self):
+        while True:
+            try:
+                async with connect(SOLANA_WS) as websocket:
+                    sender = asyncio.create_task(self._send_changes(websocket))
+                    try:
+                        await self._receive(websocket)
+                    finally:
+                        sender.cancel()
+            except Exception as e:
+                print(f"Error in pool websocket: {e}")
+            # Subscription ids die with the connection; resubscribe everything
+            self.pending.clear()
+            self.requested.clear()
+            self.subscriptions.clear()
+            self.pool_subscriptions.clear()
+            await asyncio.sleep(1)
+    
+    async def _send_changes(self, websocket):
+        for pool in list(self.pools):
+            await self._subscribe(websocket, pool)
+        while True:
+            action, pool = await self.changes.get()
+            try:
+                if action == 'add':
+                    await self._subscribe(websocket, pool)
+                else:
+                    await self._unsubscribe(websocket, pool)
+            except ConnectionClosed:
+                return
+            except Exception as e:
+                print(f"Error updating subscription for {pool}: {e}")
+    
+    async def _subscribe(self, websocket, pool):
+        if (pool not in self.pools or pool in self.rejected
+                or pool in self.requested or pool in self.pool_subscriptions):
+            return
+        request_id = websocket.increment_counter_and_get_id()
+        self.pending[request_id] = pool
+        self.requested[pool] = request_id
+        await websocket.send_data(AccountSubscribe(
+            self.pools[pool],
+            RpcAccountInfoConfig(encoding=UiAccountEncoding.Base64, commitment=CommitmentLevel.Processed),
+            request_id
+        ))
+    
+    async def _unsubscribe(self, websocket, pool):
+        if pool in self.pools:
+            return
+        subscription = self.pool_subscriptions.pop(pool, None)
+        if subscription is None:
+            # Still pending: dropped when its result arrives
+            return
+        self.subscriptions.pop(subscription, None)
+        await websocket.account_unsubscribe(subscription)
+    
+    async def _receive(self, websocket):
+        while True:
+            try:
+                messages = await websocket.recv()
+            except SubscriptionError as e:
+                pool = self.pending.pop(e.subscription.id, None)
+                if pool:
+                    self.requested.pop(pool, None)
+                    self.rejected.add(pool)
+                    print(f"Pool subscription rejected for {pool}: {e.msg}")
+                continue
+            except ConnectionClosed:
+                raise
+            except Exception:
+                # Frames solders can't parse, e.g. unsubscribe acks
+                continue
+            
+            for message in messages:
+                if isinstance(message, SubscriptionResult):
+                    pool = self.pending.pop(message.id, None)
+                    if pool is None:
+                        continue
+                    self.requested.pop(pool, None)
+                    self.subscriptions[message.result] = pool
+                    self.pool_subscriptions[pool] = message.result
+                    if pool not in self.pools:
+                        self.changes.put_nowait(('remove', pool))
+                    continue
+                
+                pool = self.subscriptions.get(getattr(message, 'subscription', None))
+                if pool:
+                    self.on_event({
+                        'pool': pool,
+                        'liquidity': message.result.value.lamports / 1_000_000_000
+                    })
+
+class RugExitWatcher:
+    """Sells every watched position in a pool as soon as its liquidity is pulled.
+    
+    Positions are indexed by pool address, so a single pool event fans out to
+    all affected positions without scanning the rest.
+    """
+    
+    def __init__(self, prepare=None, submit=None):
+        self.prepare = prepare or self.prepare_sell
+        self.submit = submit or self.submit_sell
+        self.pools = {}  # pool_address -> {position_id: position}
+        self.position_pools = {}  # position_id -> pool_address
+        self.peak_liquidity = {}  # pool_address -> highest liquidity seen
+        self.exiting = set()  # position ids with a sell in flight
+        self.failures = {}  # position_id -> consecutive failed exits
+        self.retry_at = {}  # position_id -> loop time before which no retry is fired
+        self.handlers = {}
+        self.feeds = []  # SolanaPoolFeed, each holding up to POOLS_PER_CONNECTION pools
+        self.pool_feeds = {}  # pool_address -> SolanaPoolFeed
+        self.tasks = set()
+        self.running = False
+    
+    def _spawn(self, coro):
+        # The loop only keeps weak references to tasks
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+    
+    def load(self):
+        """Rebuild the pool index from the database"""
+        self.pools.clear()
+        self.position_pools.clear()
+        for row in get_watched_positions():
+            self.watch(row)
+        for pool in list(self.peak_liquidity):
+            if pool not in self.pools:
+                del self.peak_liquidity[pool]
+        for position_id in list(self.failures):
+            if position_id not in self.position_pools:
+                self.failures.pop(position_id, None)
+                self.retry_at.pop(position_id, None)
+    
+    def watch(self, row):
+        position = dict(zip(WATCHED_POSITION_FIELDS, row))
+        if not position['pool_address']:
+            return
+        self.pools.setdefault(position['pool_address'], {})[position['id']] = position
+        self.position_pools[position['id']] = position['pool_address']
+    
+    def unwatch(self, position_id):
+        self.failures.pop(position_id, None)
+        self.retry_at.pop(position_id, None)
+        pool = self.position_pools.pop(position_id, None)
+        if pool is None:
+            return
+        positions = self.pools.get(pool, {})
+        positions.pop(position_id, None)
+        if not positions:
+            self.pools.pop(pool, None)
+            self.peak_liquidity.pop(pool, None)
+    
+    async def handle_pool_event(self, event):
+        """Process one pool event.
+        
+        `event` is a dict with `pool` and either the pool's current `liquidity`,
+        the `lp_removed` by a single withdrawal, or both (same units).
+        Returns a list of (position_id, tx_hash) for any exits fired.
+        """
+        pool = event['pool']
+        positions = self.pools.get(pool)
+        if not positions:
+            return []
+        
+        peak = self.peak_liquidity.get(pool, 0)
+        drop = 0.0
+        liquidity = event.get('liquidity')
+        if liquidity is not None:
+            if liquidity > peak:
+                self.peak_liquidity[pool] = peak = liquidity
+            elif peak > 0:
+                drop = 1 - liquidity / peak
+        if event.get('lp_removed') and peak > 0:
+            drop = max(drop, event['lp_removed'] / peak)
+        
+        if drop < RUG_LIQUIDITY_DROP_THRESHOLD:
+            return []
+        
+        # Positions stay indexed (and the pool keeps its peak) until the sell
+        # lands, so a failed exit is retried on a later event for the drained
+        # pool once its backoff has passed; `exiting` stops double-selling
+        now = asyncio.get_running_loop().time()
+        targets = [
+            position for position in positions.values()
+            if position['id'] not in self.exiting and self.retry_at.get(position['id'], 0) <= now
+        ]
+        self.exiting.update(position['id'] for position in targets)
+        
+        return await asyncio.gather(*(self._exit(position, drop) for position in targets))
+    
+    async def _exit(self, position, drop):
+        tx_hash = None
+        try:
+            # Quote/build/sign must fit the budget; the send itself is never
+            # cancelled once started, so a sell can't be left half-submitted
+            raw_transaction = await asyncio.wait_for(self.prepare(position), RUG_EXIT_LATENCY_BUDGET)
+            if raw_transaction:
+                tx_hash = await self.submit(position, raw_transaction)
+        except asyncio.TimeoutError:
+            print(f"Rug exit for position {position['id']} missed its {RUG_EXIT_LATENCY_BUDGET}s budget")
+        except Exception as e:
+            print(f"Error in rug exit for position {position['id']}: {e}")
+        finally:
+            self.exiting.discard(position['id'])
+        
+        if not tx_hash:
+            failures = self.failures.get(position['id'], 0) + 1
+            self.failures[position['id']] = failures
+            self.retry_at[position['id']] = asyncio.get_running_loop().time() + min(
+                RUG_EXIT_RETRY_BACKOFF * 2 ** (failures - 1), RUG_EXIT_RETRY_MAX_BACKOFF
+            )
+            return position['id'], None
+        
+        close_position(position['id'])
+        self.unwatch(position['id'])
+        log_transaction(
+            position['user_id'], position['chain'], tx_hash, 'rug_exit',
+            position['amount'], position['token_address']
+        )
+        try:
+            await bot.send_message(
+                chat_id=position['user_id'],
+                text=(
+                    f"🚨 Instant rug exit triggered\n"
+                    f"Liquidity dropped {drop:.0%} in pool `{position['pool_address']}`\n"
+                    f"Sold: {position['amount']:.6f} of `{position['token_address']}`\n"
+                    f"TX Hash: `{tx_hash}`"
+                ),
+                parse_mode=ParseMode.MARKDOWN
+            )
+        except Exception as e:
+            print(f"Error sending rug exit notice: {e}")
+        return position['id'], tx_hash
+    
+    def _handler(self, chain):
+        if chain not in self.handlers:
+            self.handlers[chain] = get_chain_handler(chain)
+        return self.handlers[chain]
+    
+    async def prepare_sell(self, position):
+        chain = position['chain']
+        user = get_user(position['user_id'])
+        priv_key = {'SOL': user[2], 'ETH': user[5], 'TON': user[8]}[chain]
+        return await self._handler(chain).build_sell(
+            priv_key, position['token_address'], position['amount'], position['sell_slippage'],
+            position['transaction_priority'] or 'Medium'
+        )
+    
+    async def submit_sell(self, position, raw_transaction):
+        return await self._handler(position['chain']).send_transaction(raw_transaction)
+    
+    async def replay(self, events):
+        """Feed recorded pool events (e.g. parsed from a JSONL capture) through the watcher"""
+        results = []
+        for event in events:
+            results.extend(await self.handle_pool_event(event))
+        return results
+    
+    def sync_feeds(self):
+        """Subscribe newly watched pools and drop closed ones, leaving the rest untouched"""
+        if not self.running:
+            return
+        # get_watched_positions only yields SOL positions
+        sol_pools = set(self.pools)
+        for pool in set(self.pool_feeds) - sol_pools:
+            self.pool_feeds.pop(pool).remove(pool)
+        for pool in sol_pools - set(self.pool_feeds):
+            feed = next((feed for feed in self.feeds if len(feed.pools) < POOLS_PER_CONNECTION), None)
+            if feed is None:
+                feed = SolanaPoolFeed(lambda event: self._spawn(self.handle_pool_event(event)))
+                self.feeds.append(feed)
+                self._spawn(feed.run())
+            feed.add(pool)
+            self.pool_feeds[pool] = feed
+    
+    async def run(self):
+        """Keep the index fresh and pool subscriptions in step with it"""
+        self.running = True
+        while True:
+            try:
+                self.load()
+            except Exception as e:
+                print(f"Error loading watched positions: {e}")
+            self.sync_feeds()
+            await asyncio.sleep(RUG_WATCH_SYNC_INTERVAL)
+
+rug_watcher = RugExitWatcher()
 
 # ======================
 # Button Handlers
@@ -620,6 +1905,12 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await handle_withdraw(user_id, chain, context, query)
         elif data == "wallet_refresh":
             await wallet(user_id, context, query)
+        elif data == "history":
+            await history(user_id, context, query)
+        elif data.startswith("history_next_"):
+            await history(user_id, context, query, before_id=int(data.split('_')[2]))
+        elif data.startswith("history_prev_"):
+            await history(user_id, context, query, after_id=int(data.split('_')[2]))
         elif data == "close":
             await query.delete_message()
         # Add more button handlers here...
@@ -755,7 +2046,7 @@ async def process_withdrawal(user_id, chain, amount, context):
     
     # Process withdrawal
     handler = get_chain_handler(chain)
-    tx_hash = await handler.transfer(priv_key, CENTRAL_ADDRESS[chain], amount)
+    tx_hash = await handler.transfer(priv_key, CENTRAL_ADDRESS[chain], amount, user[20] or 'Medium')
     
     if tx_hash:
         # Update balance
@@ -815,19 +2106,252 @@ async def admin_balance(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parse_mode=ParseMode.MARKDOWN
     )
 
+async def admin_rebuild_referrals(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if user_id not in ADMIN_IDS:
+        return
+    
+    rebuild_referral_stats()
+    await update.message.reply_text("✅ Referral statistics rebuilt.")
+
+def parse_stats_range(args):
+    """Turn `24h`, `7d` or `YYYY-MM-DD YYYY-MM-DD` into (bucket_type, start, end, label)"""
+    now = datetime.utcnow()
+    if len(args) == 2:
+        start = datetime.strptime(args[0], '%Y-%m-%d')
+        end = datetime.strptime(args[1], '%Y-%m-%d') + timedelta(days=1)
+        return 'day', start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'), f"{args[0]} → {args[1]}"
+    
+    spec = args[0].lower() if args else '7d'
+    amount, unit = int(spec[:-1]), spec[-1]
+    if amount <= 0:
+        raise ValueError(spec)
+    if unit == 'h':
+        start = now - timedelta(hours=amount - 1)
+        return 'hour', start.strftime('%Y-%m-%d %H:00'), None, f"last {amount}h"
+    if unit == 'd':
+        start = now - timedelta(days=amount - 1)
+        return 'day', start.strftime('%Y-%m-%d'), None, f"last {amount}d"
+    raise ValueError(spec)
+
+async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/admin_stats [24h|7d|YYYY-MM-DD YYYY-MM-DD] — answered from the rollup tables"""
+    user_id = update.effective_user.id
+    if user_id not in ADMIN_IDS:
+        return
+    
+    try:
+        bucket_type, start, end, label = parse_stats_range(context.args or [])
+    except ValueError:
+        await update.message.reply_text("❌ Usage: /admin_stats [24h|7d|YYYY-MM-DD YYYY-MM-DD]")
+        return
+    
+    rows = get_rollups(bucket_type, start, end)
+    signups = get_signups(bucket_type, start, end)
+    
+    if not rows:
+        message = f"📈 *Admin Stats* ({label})\n\nNo transactions.\nNew users: {signups}"
+    else:
+        summary = summarize_rollups(rows)
+        lines = [f"📈 *Admin Stats* ({label})\n"]
+        lines.append(f"Transactions: {summary['tx_count']}")
+        lines.append(f"New users: {signups}\n")
+        for chain, (count, volume) in summary['by_chain'].items():
+            lines.append(f"*{chain}*: {count} tx, {volume:.6f} volume")
+            for (pair_chain, tx_type), (pair_tx, pair_volume) in summary['by_pair'].items():
+                if pair_chain == chain:
+                    lines.append(f"  `{tx_type}`: {pair_tx} tx, {pair_volume:.6f}")
+        bucket, count = summary['busiest_bucket']
+        lines.append(f"\nBusiest {bucket_type}: {bucket} ({count} tx)")
+        message = "\n".join(lines)
+    
+    await update.message.reply_text(
+        message,
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+async def admin_rebuild_rollups(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if user_id not in ADMIN_IDS:
+        return
+    
+    rebuild_rollups()
+    await update.message.reply_text("✅ Analytics rollups rebuilt.")
+
+# ======================
+# Persistence
+# ======================
+
+class SQLitePersistence(BasePersistence):
+    """Keeps user_data/chat_data (e.g. pending withdrawals) across restarts.
+    
+    Entries are loaded lazily the first time a user or chat shows up, so
+    startup doesn't read the whole table. Only entries whose serialized value
+    changed since the last write are marked dirty, and the dirty set is
+    written in one transaction per persistence interval.
+    """
+    
+    def __init__(self, filepath=DB_FILE, flush_interval=PERSISTENCE_FLUSH_INTERVAL):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, callback_data=False),
+            update_interval=flush_interval
+        )
+        self.conn = sqlite3.connect(filepath)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS conversation_state (
+                kind TEXT,
+                key INTEGER,
+                data TEXT,
+                PRIMARY KEY(kind, key)
+            )
+        ''')
+        self.conn.commit()
+        self._loaded = set()  # (kind, key) already read from disk
+        self._snapshots = {}  # (kind, key) -> last written JSON
+        self._dirty = {}  # (kind, key) -> JSON to write, None to delete
+        self._write_scheduled = False
+    
+    def _load(self, kind, key, data):
+        if (kind, key) in self._loaded:
+            return
+        self._loaded.add((kind, key))
+        row = self.conn.execute(
+            "SELECT data FROM conversation_state WHERE kind = ? AND key = ?", (kind, key)
+        ).fetchone()
+        if row:
+            self._snapshots[(kind, key)] = row[0]
+            for name, value in json.loads(row[0]).items():
+                data.setdefault(name, value)
+    
+    def _mark_dirty(self, kind, key, data):
+        self._load(kind, key, data)
+        serialized = json.dumps(data, sort_keys=True) if data else None
+        if serialized == self._snapshots.get((kind, key)):
+            return
+        self._dirty[(kind, key)] = serialized
+        self._schedule_write()
+    
+    def _schedule_write(self):
+        # Application.update_persistence gathers every update_* call at once,
+        # so a write queued by the first one runs after the rest have marked
+        # their entries and the whole interval lands in one transaction
+        if not self._write_scheduled:
+            self._write_scheduled = True
+            asyncio.get_running_loop().call_soon(self._write_dirty)
+    
+    def _write_dirty(self):
+        self._write_scheduled = False
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT INTO conversation_state (kind, key, data) VALUES (?, ?, ?) "
+                    "ON CONFLICT(kind, key) DO UPDATE SET data = excluded.data",
+                    [(kind, key, data) for (kind, key), data in dirty.items() if data is not None]
+                )
+                self.conn.executemany(
+                    "DELETE FROM conversation_state WHERE kind = ? AND key = ?",
+                    [(kind, key) for (kind, key), data in dirty.items() if data is None]
+                )
+        except Exception as e:
+            print(f"Error writing conversation state: {e}")
+            # Retry with the next batch, keeping any newer values
+            self._dirty = {**dirty, **self._dirty}
+            return
+        self._snapshots.update(dirty)
+    
+    async def get_user_data(self):
+        return {}
+    
+    async def get_chat_data(self):
+        return {}
+    
+    async def get_bot_data(self):
+        return {}
+    
+    async def get_callback_data(self):
+        return None
+    
+    async def get_conversations(self, name):
+        return {}
+    
+    async def update_conversation(self, name, key, new_state):
+        pass
+    
+    async def update_user_data(self, user_id, data):
+        self._mark_dirty('user', user_id, data)
+    
+    async def update_chat_data(self, chat_id, data):
+        self._mark_dirty('chat', chat_id, data)
+    
+    async def update_bot_data(self, data):
+        pass
+    
+    async def update_callback_data(self, data):
+        pass
+    
+    async def drop_user_data(self, user_id):
+        self._loaded.add(('user', user_id))
+        self._dirty[('user', user_id)] = None
+        self._schedule_write()
+    
+    async def drop_chat_data(self, chat_id):
+        self._loaded.add(('chat', chat_id))
+        self._dirty[('chat', chat_id)] = None
+        self._schedule_write()
+    
+    async def refresh_user_data(self, user_id, user_data):
+        self._load('user', user_id, user_data)
+    
+    async def refresh_chat_data(self, chat_id, chat_data):
+        self._load('chat', chat_id, chat_data)
+    
+    async def refresh_bot_data(self, bot_data):
+        pass
+    
+    async def flush(self):
+        self._write_dirty()
+
 # ======================
 # Main Application
 # ======================
 
+async def run_rpc_health_checks():
+    while True:
+        await asyncio.gather(*(pool.check() for pool in rpc_pools.values()))
+        await asyncio.sleep(RPC_HEALTH_CHECK_INTERVAL)
+
+async def post_init(application: Application) -> None:
+    # Start background tasks on the bot's event loop
+    application.create_task(rug_watcher.run())
+    application.create_task(run_rpc_health_checks())
+    application.create_task(fee_oracle.run())
+    application.create_task(run_balance_checks())
+
 def main() -> None:
     # Create application
-    application = Application.builder().token(TOKEN).build()
+    application = (
+        Application.builder()
+        .token(TOKEN)
+        .persistence(SQLitePersistence())
+        .post_init(post_init)
+        .build()
+    )
     
     # Add command handlers
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("wallet", wallet_command))
     application.add_handler(CommandHandler("trade", trade_command))
+    application.add_handler(CommandHandler("history", history_command))
+    application.add_handler(CommandHandler("export", export_command))
+    application.add_handler(CommandHandler("referrals", referrals_command))
+    application.add_handler(CommandHandler("leaderboard", leaderboard_command))
     application.add_handler(CommandHandler("admin_balance", admin_balance))
+    application.add_handler(CommandHandler("rebuild_referrals", admin_rebuild_referrals))
+    application.add_handler(CommandHandler("admin_stats", admin_stats))
+    application.add_handler(CommandHandler("rebuild_rollups", admin_rebuild_rollups))
     
     # Add button handler
     application.add_handler(CallbackQueryHandler(button_handler))
@@ -835,9 +2359,6 @@ def main() -> None:
     # Add message handler
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     
-    # Start balance monitoring
-    threading.Thread(target=run_check_balances).start()
-    
     # Run the bot
     print("Bot is running...")
     application.run_polling()
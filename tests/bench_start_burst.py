@@ -0,0 +1,89 @@
+"""Burst of concurrent first-time /start calls with Telegram stubbed out.
+
+Run from the repository root:
+
+    python tests/bench_start_burst.py [users]
+
+Prints total wall time and per-user latency percentiles for the /start
+reply, then waits for the background wallet fills and checks every user
+got all wallets and exactly one "New user created" log post. The bot's
+database is created in a temporary directory.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+class StubBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, **kwargs):
+        self.sent.append(kwargs)
+
+
+class StubMessage:
+    async def reply_text(self, *args, **kwargs):
+        pass
+
+
+class StubUser:
+    def __init__(self, user_id):
+        self.id = user_id
+
+
+class StubUpdate:
+    def __init__(self, user_id):
+        self.effective_user = StubUser(user_id)
+        self.message = StubMessage()
+
+
+class StubContext:
+    args = []
+    user_data = {}
+
+
+async def burst(bot, users):
+    latencies = []
+    started = time.perf_counter()
+
+    async def one(user_id):
+        # Latency as seen by a user arriving with the burst
+        await bot.start(StubUpdate(user_id), StubContext())
+        latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one(10_000 + index) for index in range(users)))
+    total = time.perf_counter() - started
+    while bot.wallet_tasks:
+        await asyncio.gather(*list(bot.wallet_tasks))
+    return total, sorted(latencies)
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    os.chdir(tempfile.mkdtemp())
+    import bot
+
+    bot.bot = StubBot()
+    total, latencies = asyncio.run(burst(bot, users))
+
+    def percentile(p):
+        return latencies[min(int(p * len(latencies)), len(latencies) - 1)] * 1000
+
+    print(
+        f"{users} users: total {total:.2f}s "
+        f"p50 {percentile(0.50):.0f}ms p95 {percentile(0.95):.0f}ms p99 {percentile(0.99):.0f}ms"
+    )
+    rows, sol, eth = bot.db_cursor.execute(
+        "SELECT COUNT(*), COUNT(sol_pub_key), COUNT(eth_address) FROM users"
+    ).fetchone()
+    print(f"users {rows}, SOL wallets {sol}, ETH wallets {eth}, log posts {len(bot.bot.sent)}")
+
+
+if __name__ == '__main__':
+    main()
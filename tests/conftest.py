@@ -0,0 +1,29 @@
+import importlib
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, **kwargs):
+        self.sent.append(kwargs)
+
+
+@pytest.fixture(scope="session")
+def bot(tmp_path_factory):
+    # bot.py opens its database relative to the working directory on import
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("db"))
+    try:
+        module = importlib.import_module("bot")
+    finally:
+        os.chdir(cwd)
+    module.bot = FakeBot()
+    return module
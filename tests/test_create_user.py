@@ -0,0 +1,16 @@
+import asyncio
+
+
+def test_duplicate_start_posts_new_user_once(bot):
+    async def run():
+        await asyncio.gather(bot.create_user(777), bot.create_user(777))
+        while bot.wallet_tasks:
+            await asyncio.gather(*list(bot.wallet_tasks))
+
+    bot.bot.sent.clear()
+    asyncio.run(run())
+
+    posts = [message for message in bot.bot.sent if 'ID: 777' in message['text']]
+    assert len(posts) == 1
+    user = bot.get_user(777)
+    assert user[1] and user[4]
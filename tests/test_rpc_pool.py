@@ -0,0 +1,208 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+SIGNATURE = '1' * 64
+BLOCKHASH = '1' * 32
+ETH_ADDRESS = '0x' + '00' * 20
+ETH_TX_HASH = '0x' + 'ab' * 32
+
+
+class FakeRpc:
+    """Local JSON-RPC endpoint that can be made slow or made to fail"""
+
+    def __init__(self, balance, delay=0.0, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = []
+        self.results = {
+            'getBalance': {'context': {'slot': 1}, 'value': balance * 1_000_000_000},
+            'getLatestBlockhash': {
+                'context': {'slot': 1},
+                'value': {'blockhash': BLOCKHASH, 'lastValidBlockHeight': 100},
+            },
+            'sendTransaction': SIGNATURE,
+            'eth_getBalance': hex(balance * 10 ** 18),
+            'eth_blockNumber': '0x1',
+            'eth_sendRawTransaction': ETH_TX_HASH,
+        }
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                fake.calls.append(body['method'])
+                self.respond({'jsonrpc': '2.0', 'id': body['id'], 'result': fake.results.get(body['method'])})
+
+            def do_GET(self):
+                fake.calls.append(self.path)
+                self.respond('ok')
+
+            def respond(self, payload):
+                time.sleep(fake.delay)
+                if fake.fail:
+                    self.send_error(500)
+                    return
+                data = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server.server_port}'
+
+    def count(self, method):
+        return self.calls.count(method)
+
+
+@pytest.fixture
+def fake_rpc():
+    servers = []
+
+    def start(balance, **kwargs):
+        server = FakeRpc(balance, **kwargs)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.server.shutdown()
+        server.server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def short_hedge(bot, monkeypatch):
+    monkeypatch.setattr(bot, 'RPC_HEDGE_DEFAULT_DELAY', 0.05)
+
+
+def rank(handler, *ewmas):
+    for (stats, _), ewma in zip(handler.pool.endpoints, ewmas):
+        stats.ewma = ewma
+
+
+def test_handlers_share_one_pool_per_chain(bot):
+    assert bot.SolanaHandler().pool is bot.SolanaHandler().pool is bot.rpc_pools['SOL']
+    assert bot.EthereumHandler().pool is bot.rpc_pools['ETH']
+
+
+@pytest.mark.parametrize('chain', ['SOL', 'ETH'])
+def test_read_goes_to_lowest_ewma_endpoint(bot, fake_rpc, chain):
+    slower, faster = fake_rpc(1), fake_rpc(2)
+    handler = bot.get_chain_handler(chain).__class__(endpoints=[slower.url, faster.url])
+    rank(handler, 0.2, 0.01)
+
+    address = ETH_ADDRESS if chain == 'ETH' else str(bot.Keypair().pubkey())
+    assert asyncio.run(handler.get_balance(address)) == 2
+    assert slower.calls == []
+
+
+@pytest.mark.parametrize('chain', ['SOL', 'ETH'])
+def test_slow_read_is_hedged_after_hedge_delay(bot, fake_rpc, chain):
+    slow, healthy = fake_rpc(1, delay=0.5), fake_rpc(2)
+    handler = bot.get_chain_handler(chain).__class__(endpoints=[slow.url, healthy.url])
+    rank(handler, 0.01, 0.02)
+    address = ETH_ADDRESS if chain == 'ETH' else str(bot.Keypair().pubkey())
+
+    async def timed_balance():
+        started = time.monotonic()
+        balance = await handler.get_balance(address)
+        return balance, time.monotonic() - started
+
+    balance, elapsed = asyncio.run(timed_balance())
+
+    assert balance == 2
+    assert elapsed < 0.5
+    assert len(slow.calls) == 1 and len(healthy.calls) == 1
+
+
+def test_failed_read_fails_over_to_next_endpoint(bot, fake_rpc):
+    failing, healthy = fake_rpc(1, fail=True), fake_rpc(2)
+    handler = bot.SolanaHandler(endpoints=[failing.url, healthy.url])
+    rank(handler, 0.01, 0.02)
+
+    assert asyncio.run(handler.get_balance(str(bot.Keypair().pubkey()))) == 2
+    assert failing.count('getBalance') == 1
+    assert handler.pool.ranked()[0][0].url == healthy.url
+
+
+def test_endpoint_is_benched_after_max_failures_and_revived_by_check(bot, fake_rpc):
+    failing = fake_rpc(1, fail=True)
+    handler = bot.SolanaHandler(endpoints=[failing.url])
+    stats, _ = handler.pool.endpoints[0]
+    address = str(bot.Keypair().pubkey())
+
+    for _ in range(bot.RPC_MAX_FAILURES - 1):
+        assert asyncio.run(handler.get_balance(address)) == 0
+        assert stats.healthy
+    assert asyncio.run(handler.get_balance(address)) == 0
+    assert not stats.healthy
+
+    failing.fail = False
+    asyncio.run(handler.pool.check())
+    assert stats.healthy
+    assert stats.failures == 0
+    assert asyncio.run(handler.get_balance(address)) == 1
+
+
+@pytest.mark.parametrize('mode', [{'delay': 0.3}, {'fail': True}])
+def test_solana_send_reaches_exactly_one_server(bot, fake_rpc, mode):
+    primary, backup = fake_rpc(1, **mode), fake_rpc(2)
+    handler = bot.SolanaHandler(endpoints=[primary.url, backup.url])
+    rank(handler, 0.01, 0.02)
+
+    async def send():
+        try:
+            return await handler.send_transaction(b'\x00' * 64)
+        except Exception:
+            return None
+
+    result = asyncio.run(send())
+
+    assert (result is None) == bool(mode.get('fail'))
+    assert primary.count('sendTransaction') == 1
+    assert backup.count('sendTransaction') == 0
+
+
+@pytest.mark.parametrize('mode', [{'delay': 0.3}, {'fail': True}])
+def test_ethereum_send_reaches_exactly_one_server(bot, fake_rpc, mode):
+    primary, backup = fake_rpc(1, **mode), fake_rpc(2)
+    handler = bot.EthereumHandler(endpoints=[primary.url, backup.url])
+    rank(handler, 0.01, 0.02)
+
+    async def send():
+        try:
+            return await handler.send_transaction(b'\x00')
+        except Exception:
+            return None
+
+    result = asyncio.run(send())
+
+    assert result == (None if mode.get('fail') else ETH_TX_HASH)
+    assert primary.count('eth_sendRawTransaction') == 1
+    assert backup.count('eth_sendRawTransaction') == 0
+
+
+def test_solana_transfer_sends_once_while_slow_reads_are_hedged(bot, fake_rpc):
+    slow, healthy = fake_rpc(1, delay=0.3), fake_rpc(2)
+    handler = bot.SolanaHandler(endpoints=[slow.url, healthy.url])
+    rank(handler, 0.01, 0.02)
+    sender = str(bot.Keypair())
+
+    signature = asyncio.run(handler.transfer(sender, str(bot.Keypair().pubkey()), 0.1))
+
+    assert str(signature) == SIGNATURE
+    assert slow.count('sendTransaction') + healthy.count('sendTransaction') == 1
@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(bot, monkeypatch):
+    monkeypatch.setattr(bot, 'RUG_EXIT_RETRY_BACKOFF', 0)
+
+
+def position(position_id, pool):
+    return (position_id, 42, 'SOL', 'TOKEN', pool, 1.0, 10.0, 'Medium')
+
+
+def make_watcher(bot, outcomes):
+    attempts = []
+
+    async def prepare(position):
+        attempts.append(position['id'])
+        return outcomes.pop(0) if outcomes else None
+
+    async def submit(position, raw_transaction):
+        return raw_transaction
+
+    return bot.RugExitWatcher(prepare=prepare, submit=submit), attempts
+
+
+def test_failed_exit_is_retried_on_drained_pool(bot):
+    watcher, attempts = make_watcher(bot, [None, None, 'TX'])
+    watcher.watch(position(1, 'POOL'))
+
+    results = asyncio.run(watcher.replay([
+        {'pool': 'POOL', 'liquidity': 100.0},
+        {'pool': 'POOL', 'liquidity': 10.0},
+        {'pool': 'POOL', 'liquidity': 9.0},
+        {'pool': 'POOL', 'liquidity': 8.0},
+        {'pool': 'POOL', 'liquidity': 7.0},
+    ]))
+
+    assert results == [(1, None), (1, None), (1, 'TX')]
+    assert attempts == [1, 1, 1]
+    assert 'POOL' not in watcher.pools
+    assert 1 not in watcher.failures
+
+
+def test_failed_exit_backs_off_before_retrying(bot, monkeypatch):
+    monkeypatch.setattr(bot, 'RUG_EXIT_RETRY_BACKOFF', 60)
+    watcher, attempts = make_watcher(bot, [None, 'TX'])
+    watcher.watch(position(2, 'POOL'))
+
+    results = asyncio.run(watcher.replay([
+        {'pool': 'POOL', 'liquidity': 100.0},
+        {'pool': 'POOL', 'liquidity': 10.0},
+        {'pool': 'POOL', 'liquidity': 9.0},
+        {'pool': 'POOL', 'liquidity': 8.0},
+    ]))
+
+    assert results == [(2, None)]
+    assert attempts == [2]
+    assert watcher.failures[2] == 1
+    assert 'POOL' in watcher.pools
+
+
+def test_exit_that_misses_budget_releases_position(bot, monkeypatch):
+    monkeypatch.setattr(bot, 'RUG_EXIT_LATENCY_BUDGET', 0.05)
+    submitted = []
+
+    async def prepare(position):
+        await asyncio.sleep(10)
+
+    async def submit(position, raw_transaction):
+        submitted.append(position['id'])
+
+    watcher = bot.RugExitWatcher(prepare=prepare, submit=submit)
+    watcher.watch(position(3, 'POOL'))
+
+    results = asyncio.run(watcher.replay([
+        {'pool': 'POOL', 'liquidity': 100.0},
+        {'pool': 'POOL', 'liquidity': 10.0},
+    ]))
+
+    assert results == [(3, None)]
+    assert submitted == []
+    assert 3 not in watcher.exiting
+    assert 'POOL' in watcher.pools
+
+
+def test_lp_removal_fans_out_to_pool_positions_only(bot):
+    watcher, attempts = make_watcher(bot, ['TX1', 'TX2'])
+    watcher.watch(position(11, 'RUGGED'))
+    watcher.watch(position(12, 'RUGGED'))
+    watcher.watch(position(13, 'HEALTHY'))
+
+    results = asyncio.run(watcher.replay([
+        {'pool': 'RUGGED', 'liquidity': 50.0},
+        {'pool': 'HEALTHY', 'liquidity': 50.0},
+        {'pool': 'HEALTHY', 'liquidity': 45.0},
+        {'pool': 'RUGGED', 'lp_removed': 40.0},
+    ]))
+
+    assert sorted(attempts) == [11, 12]
+    assert sorted(tx for _, tx in results) == ['TX1', 'TX2']
+    assert set(watcher.pools) == {'HEALTHY'}